@@ -1,14 +1,17 @@
 # app_seguimiento_contratos_mejorado_v6.py
 # Streamlit app: seguimiento de contratos - CRUD (SQLite) + alertas (semáforo) + tablero
 # Requisitos:
-#   pip install streamlit pandas openpyxl python-dateutil plotly
+#   pip install "streamlit>=1.37" pandas numpy xlsxwriter python-dateutil plotly
 
 import streamlit as st
 import sqlite3
+import threading
 import pandas as pd
-from datetime import datetime, date
+import numpy as np
+from datetime import date, timedelta
 from dateutil import parser
 import io
+import xlsxwriter
 import plotly.express as px
 
 # ==============================
@@ -82,111 +85,368 @@ COLUMNS = [
     "Alerta Enviada"
 ]
 
+# --- Tipos de columna ---
+MONEY_COLUMNS = [
+    "Valor estimado en la vigencia actual",
+    "Adición CDP",
+    "Valor disminuido CDP",
+    "Valor total CDP",
+    "Valor contratado",
+    "Saldo disponible CDP",
+    "Adición en la ejecución",
+    "Valor total contratado"
+]
+DATE_COLUMNS = [
+    "Fecha de estructuración",
+    "Fecha de envio a Contratos",
+    "Fecha de respuesta de contratos",
+    "Fecha acta de inicio / Fecha Inicio",
+    "Fecha Final Contrato",
+    "Fecha final de licencia/servicio"
+]
+# Las fechas siguen en TEXT (ISO) y se leen con parse_dates
+COLUMN_TYPES = {col: "REAL" for col in MONEY_COLUMNS}
+# Columnas de baja cardinalidad que se cargan como category
+CATEGORY_COLUMNS = [
+    "Estado Actual del Proceso",
+    "Tipo de Contrato",
+    "Fuente de financiamiento",
+    "Modalidad de selección",
+    "Supervisor",
+    "Abogado OTIC",
+    "Mes de inicio1",
+    "Mes de inicio2"
+]
+TYPED_COLUMNS = frozenset(MONEY_COLUMNS + DATE_COLUMNS)
+DATE_FIELDS = frozenset(DATE_COLUMNS)
+
+# Columnas que el Excel exportado lleva como números (Mes de inicio guarda nombres de mes)
+NUMERIC_COLUMNS = ["Número del contrato"] + MONEY_COLUMNS
+
+# Columnas que se filtran con multiselección; el resto de texto usa búsqueda libre
+MULTISELECT_FILTER_COLUMNS = [
+    "Estado Actual del Proceso",
+    "Tipo de Contrato",
+    "Fuente de financiamiento",
+    "Modalidad de selección",
+    "Proveedor / Contratista",
+    "Supervisor",
+    "Código Interno / Proceso",
+    "Nombre del Proceso / Objeto del Contrato"
+]
+# Índices para las columnas más filtradas
+INDEXES = {
+    "idx_codigo": "Código Interno / Proceso",
+    "idx_estado": "Estado Actual del Proceso",
+    "idx_proveedor": "Proveedor / Contratista",
+    "idx_fecha_final": "Fecha Final Contrato"
+}
+
 # --- Opciones parametrizadas ---
 ESTADO_PROCESO_OPTS = ['Iniciado', 'Estructuración', 'En proceso de selección', 'Adjudicado', 'Perfeccionamiento del Contrato', 'En Ejecución', 'Liquidado']
 TIPO_CONTRATO_OPTS = ['Bienes y servicios']
 FUENTE_FINANCIAMIENTO_OPTS = ['Funcionamiento', 'Inversión']
 MODALIDAD_SELECCION_OPTS = ['Mínima Cuantía', 'Selección Abreviada - Acuerdo Marco', 'Contratación Directa']
 MESES = ["", "Enero", "Febrero", "Marzo", "Abril", "Mayo", "Junio", "Julio", "Agosto", "Septiembre", "Octubre", "Noviembre", "Diciembre"]
+# Posición de cada opción en los selectbox del formulario ('' ocupa la posición 0)
+ESTADO_IDX = {o: i + 1 for i, o in enumerate(ESTADO_PROCESO_OPTS)}
+TIPO_IDX = {o: i + 1 for i, o in enumerate(TIPO_CONTRATO_OPTS)}
+FUENTE_IDX = {o: i + 1 for i, o in enumerate(FUENTE_FINANCIAMIENTO_OPTS)}
+MODALIDAD_IDX = {o: i + 1 for i, o in enumerate(MODALIDAD_SELECCION_OPTS)}
+MESES_IDX = {m: i for i, m in enumerate(MESES)}
+# Distribución de campos del formulario de edición: filas de valores y textos de "Otros Detalles"
+MONEY_FIELD_ROWS = (MONEY_COLUMNS[:3], MONEY_COLUMNS[3:6], MONEY_COLUMNS[6:])
+OTHER_TEXT_FIELDS = [
+    "Número del contrato",
+    "Abogado OTIC",
+    "Estructurador Técnico OTIC",
+    "Abogados GIT Gestión Contractual",
+    "Economico GIT",
+    "Enlace SharePoint",
+    "Seguimiento periódico",
+    "Alerta Enviada"
+]
+# Las gráficas de barras muestran como máximo las categorías más frecuentes
+MAX_BAR_CATEGORIES = 20
 
 # --- Utilidades ---
-def safe_parse_date(s):
-    if s is None or str(s).strip() == "":
+def days_remaining(df) -> pd.Series:
+    ffc = pd.to_datetime(df['Fecha Final Contrato'], errors='coerce').dt.normalize()
+    return (ffc - pd.Timestamp.today().normalize()).dt.days
+
+SEMAFORO_COLORS = np.array(['🔴', '🟡', '🟢', '⚪'])
+
+def alert_codes(days: np.ndarray, sent: np.ndarray) -> np.ndarray:
+    # Códigos int8 (índices de SEMAFORO_COLORS); NaN = sin fecha queda en ⚪
+    codes = np.full(days.size, 3, dtype=np.int8)
+    codes[days > 90] = 2
+    codes[days <= 90] = 1
+    codes[days <= 30] = 0
+    codes[sent] = 2
+    return codes
+
+def compute_alert_colors(df, days=None) -> pd.Series:
+    if days is None:
+        days = days_remaining(df)
+    sent = df['Alerta Enviada'].astype(str).str.strip().str.lower().isin({'si', 'sí', 's', 'true', '1'})
+    codes = alert_codes(days.to_numpy(dtype='float64'), sent.to_numpy())
+    return pd.Series(SEMAFORO_COLORS[codes], index=df.index)
+
+def format_numeric_series(s):
+    # Valores numéricos sin decimales; el texto no numérico se conserva
+    n = pd.to_numeric(s, errors='coerce').astype('float64')
+    # Solo lo que cabe en int64; infinitos y cifras enormes se muestran como texto original
+    ok = np.isfinite(n) & (n.abs() < 2**63)
+    return np.where(ok, n.where(ok, 0).astype('int64').astype(str), s.fillna('').astype(str))
+
+def _to_int(v):
+    return int(v) if pd.notna(v) else 0
+
+def _to_str(v):
+    return "" if pd.isna(v) else str(v)
+
+def _to_date(v):
+    return v.date() if pd.notna(v) else None
+
+# --- DB helpers ---
+@st.cache_resource
+def get_conn():
+    conn = sqlite3.connect(DB_FILE, check_same_thread=False)
+    conn.executescript(
+        "PRAGMA journal_mode=WAL;"
+        "PRAGMA synchronous=NORMAL;"
+        "PRAGMA temp_store=MEMORY;"
+        "PRAGMA cache_size=-65536;"
+        "PRAGMA busy_timeout=5000;"
+    )
+    # Búsqueda sin distinguir mayúsculas también para tildes/ñ (lower() de SQLite es solo ASCII)
+    conn.create_function("casefold", 1, lambda v: None if v is None else str(v).casefold(), deterministic=True)
+    # La conexión es compartida por todas las sesiones: el candado serializa transacciones y lecturas
+    return conn, threading.Lock()
+
+def create_table_sql(table_name):
+    cols = ", ".join([f'"{col}" {COLUMN_TYPES.get(col, "TEXT")}' for col in COLUMNS])
+    return f"CREATE TABLE IF NOT EXISTS {table_name} (id INTEGER PRIMARY KEY AUTOINCREMENT, {cols})"
+
+def to_iso_date(value):
+    # Texto de fecha en cualquier formato reconocible -> YYYY-MM-DD; lo irreconocible queda NULL
+    if value is None:
         return None
-    try:
-        return parser.parse(str(s)).date()
-    except Exception:
+    s = str(value).strip()
+    if s == "":
         return None
-
-def compute_alert_color(row):
     try:
-        if str(row.get('Alerta Enviada', '')).strip().lower() in ['si', 'sí', 's', 'true', '1']:
-            return '🟢'
-        ffc = safe_parse_date(row.get('Fecha Final Contrato'))
-        if ffc:
-            days = (ffc - date.today()).days
-            if days <= 30:
-                return '🔴'
-            elif days <= 90:
-                return '🟡'
-            else:
-                return '🟢'
-    except Exception:
+        return date.fromisoformat(s[:10]).isoformat()
+    except ValueError:
         pass
-    return '⚪'
-
-def format_currency(value):
     try:
-        if pd.isna(value) or value == "":
-            return ""
-        return f"$ {int(float(value)):,d}"
-    except (ValueError, TypeError):
-        return str(value)
-
-def format_numeric_no_decimals(value):
-    try:
-        if pd.isna(value) or value == "":
-            return ""
-        return int(float(value))
-    except (ValueError, TypeError):
-        return value
-
-def format_date_only(value):
-    try:
-        if pd.isna(value) or value == "":
-            return ""
-        return pd.to_datetime(value).strftime('%Y-%m-%d')
-    except (ValueError, TypeError):
-        return value
+        return parser.parse(s).date().isoformat()
+    except (ValueError, OverflowError):
+        return None
 
-# --- DB helpers ---
+def migrate_column_types(conn):
+    # Bases creadas con todo en TEXT: se reconstruye la tabla con columnas tipadas
+    declared = {row[1]: row[2] for row in conn.execute(f"PRAGMA table_info({TABLE_NAME})")}
+    if all(declared.get(col, "TEXT") == col_type for col, col_type in COLUMN_TYPES.items()):
+        return
+    tmp_name = f"{TABLE_NAME}_tipada"
+    cols = ", ".join([f'"{col}"' for col in COLUMNS])
+    # Fechas normalizadas a ISO (una sola lectura tolerante por valor); vacíos a NULL en
+    # columnas de valor, cuya afinidad REAL convierte el texto numérico
+    conn.create_function("iso_date", 1, to_iso_date, deterministic=True)
+    exprs = ", ".join([
+        f'iso_date("{col}")' if col in DATE_COLUMNS
+        else f"NULLIF(TRIM(\"{col}\"), '')" if col in TYPED_COLUMNS
+        else f'"{col}"'
+        for col in COLUMNS
+    ])
+    with conn:
+        conn.execute("BEGIN")
+        seq = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (TABLE_NAME,)).fetchone()
+        conn.execute(create_table_sql(tmp_name))
+        conn.execute(f"INSERT INTO {tmp_name} (id, {cols}) SELECT id, {exprs} FROM {TABLE_NAME}")
+        conn.execute(f"DROP TABLE {TABLE_NAME}")
+        conn.execute(f"ALTER TABLE {tmp_name} RENAME TO {TABLE_NAME}")
+        if seq:
+            conn.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?", (seq[0], TABLE_NAME))
+
+# Esquema, migración e índices una sola vez por proceso, no en cada rerun
+@st.cache_resource(show_spinner=False)
 def init_db():
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    cols = ", ".join([f'"{col}" TEXT' for col in COLUMNS])
-    sql = f"CREATE TABLE IF NOT EXISTS {TABLE_NAME} (id INTEGER PRIMARY KEY AUTOINCREMENT, {cols})"
-    c.execute(sql)
-    conn.commit()
-    conn.close()
+    conn, lock = get_conn()
+    with lock:
+        with conn:
+            conn.execute(create_table_sql(TABLE_NAME))
+        migrate_column_types(conn)
+        with conn:
+            for name, col in INDEXES.items():
+                conn.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {TABLE_NAME}("{col}")')
+
+def read_contracts(sql, params=()):
+    conn, lock = get_conn()
+    with lock:
+        df = pd.read_sql_query(sql, conn, params=params, parse_dates=DATE_COLUMNS)
+    df[MONEY_COLUMNS] = df[MONEY_COLUMNS].apply(pd.to_numeric, errors='coerce')
+    df[CATEGORY_COLUMNS] = df[CATEGORY_COLUMNS].fillna("").astype('category')
+    return df
 
 def df_from_db():
-    conn = sqlite3.connect(DB_FILE)
-    df = pd.read_sql_query(f"SELECT * FROM {TABLE_NAME}", conn)
-    conn.close()
-    return df
+    return read_contracts(f"SELECT * FROM {TABLE_NAME}")
+
+# Versión de datos (compartida entre sesiones): cada escritura la incrementa
+# e invalida la caché de lecturas.
+@st.cache_resource
+def _db_state():
+    return {"version": 0}
+
+def db_version():
+    return _db_state()["version"]
+
+def bump_db_version():
+    _db_state()["version"] += 1
+
+# Solo interesa la versión vigente: las anteriores se descartan en vez de acumularse en memoria
+@st.cache_data(show_spinner=False, max_entries=1)
+def load_df(version: int):
+    return df_from_db()
+
+@st.cache_data(show_spinner=False, max_entries=1)
+def column_ranges(version: int):
+    # (mín, máx) por columna de fecha/valor para los controles de filtro
+    df = load_df(version)
+    ranges = {}
+    for col in DATE_COLUMNS:
+        lo, hi = df[col].min(), df[col].max()
+        ranges[col] = (lo.date(), hi.date()) if pd.notna(lo) else (None, None)
+    for col in MONEY_COLUMNS:
+        ranges[col] = (df[col].min(), df[col].max())
+    return ranges
+
+# Unas pocas combinaciones de filtros recientes; el resto se descarta
+@st.cache_data(show_spinner=False, max_entries=16)
+def query_contracts(version: int, filters: dict):
+    # Los filtros se traducen a un WHERE parametrizado y SQLite devuelve solo las filas que cumplen
+    clauses, params = [], []
+    for col, value in filters.items():
+        if col in DATE_COLUMNS:
+            # El rango queda incompleto si solo se eligió la fecha inicial
+            if len(value) == 2:
+                clauses.append(f'"{col}" >= ? AND "{col}" < ?')
+                params += [value[0].isoformat(), (value[1] + timedelta(days=1)).isoformat()]
+        elif col in MONEY_COLUMNS:
+            clauses.append(f'"{col}" BETWEEN ? AND ?')
+            params += list(value)
+        elif col in MULTISELECT_FILTER_COLUMNS:
+            if value:
+                clauses.append(f'"{col}" IN ({",".join(["?" for _ in value])})')
+                params += list(value)
+        elif value:
+            clauses.append(f'instr(casefold("{col}"), ?) > 0')
+            params.append(value.casefold())
+    where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+    return read_contracts(f"SELECT * FROM {TABLE_NAME}{where}", params)
+
+# Varía por contrato dentro de una misma versión: se guardan solo los más recientes
+@st.cache_data(show_spinner=False, max_entries=16)
+def start_counts_by_month(version: int, codigo=None):
+    # Agregación mensual en SQLite: solo cruzan unas pocas filas hacia pandas
+    where = 'length("Fecha acta de inicio / Fecha Inicio") >= 7'
+    params = []
+    if codigo is not None:
+        where += ' AND "Código Interno / Proceso" = ?'
+        params.append(codigo)
+    sql = (
+        f'SELECT substr("Fecha acta de inicio / Fecha Inicio", 1, 7) AS "Año-Mes", COUNT(*) AS "Conteo" '
+        f'FROM {TABLE_NAME} WHERE {where} GROUP BY 1 ORDER BY 1'
+    )
+    conn, lock = get_conn()
+    with lock:
+        return pd.read_sql_query(sql, conn, params=params)
+
+@st.cache_data(show_spinner=False, max_entries=1)
+def record_options(version: int):
+    # Etiquetas "código — nombre" de los selectores de editar/eliminar
+    df = load_df(version)
+    labels = (df['Código Interno / Proceso'].fillna("").astype(str) + ' — ' + df['Nombre del Proceso / Objeto del Contrato'].fillna("").astype(str)).tolist()
+    # Búsqueda directa etiqueta -> id; con etiquetas repetidas gana el primer registro
+    ids = df['id'].tolist()
+    id_by_label = dict(zip(reversed(labels), reversed(ids)))
+    return labels, id_by_label
+
+@st.cache_data(show_spinner=False, max_entries=1)
+def export_xlsx(version: int) -> bytes:
+    # El libro se genera una vez por versión de datos, con las columnas de COLUMNS (sin 'id')
+    df_export = load_df(version).reindex(columns=COLUMNS)
+
+    # Convertir a numérico en un solo bloque; los vacíos quedan NaN (celda en blanco)
+    df_export[NUMERIC_COLUMNS] = df_export[NUMERIC_COLUMNS].apply(pd.to_numeric, errors='coerce')
+
+    output = io.BytesIO()
+    # xlsxwriter en modo constant_memory: cada fila se vuelca al escribir la siguiente.
+    # Las fechas se escriben como celdas de fecha nativas (yyyy-mm-dd)
+    wb = xlsxwriter.Workbook(output, {
+        'constant_memory': True,
+        'default_date_format': 'yyyy-mm-dd',
+        'strings_to_numbers': False,
+        'strings_to_formulas': False,
+        'strings_to_urls': False,
+    })
+    ws = wb.add_worksheet("Contratos")
+    ws.write_row(0, 0, df_export.columns)
+    # Matriz de objetos en una sola conversión; cada fila se entrega como lista
+    values = df_export.astype(object).where(df_export.notna(), None).to_numpy()
+    for row_num, row in enumerate(values, start=1):
+        ws.write_row(row_num, 0, row.tolist())
+    wb.close()
+    return output.getvalue()
+
+def form_to_text(values: dict) -> dict:
+    # Valores del formulario a texto; el tipo sale del nombre del campo (fechas en ISO)
+    return {k: "" if v is None else v.isoformat() if k in DATE_FIELDS else str(v) for k, v in values.items()}
+
+def to_db_values(values: dict) -> dict:
+    # Vacíos en columnas numéricas/fecha se guardan como NULL
+    return {k: None if v == "" and k in TYPED_COLUMNS else v for k, v in values.items()}
+
+def insert_records(rows: list[dict]):
+    if not rows:
+        return
+    keys = list(rows[0].keys())
+    cols = ", ".join([f'"{k}"' for k in keys])
+    placeholders = ",".join(["?" for _ in keys])
+    sql = f"INSERT INTO {TABLE_NAME} ({cols}) VALUES ({placeholders})"
+    conn, lock = get_conn()
+    # Una sola transacción para todo el lote; la versión sube antes de soltar el candado
+    with lock:
+        with conn:
+            conn.executemany(sql, [list(to_db_values({k: r.get(k, "") for k in keys}).values()) for r in rows])
+        bump_db_version()
 
 def insert_record(values: dict):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    cols = ", ".join([f'"{k}"' for k in values.keys()])
-    placeholders = ",".join(["?" for _ in values.keys()])
-    sql = f"INSERT INTO {TABLE_NAME} ({cols}) VALUES ({placeholders})"
-    c.execute(sql, list(values.values()))
-    conn.commit()
-    conn.close()
+    insert_records([values])
 
 def update_record(record_id: int, values: dict):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
     assignments = ", ".join([f'"{k}" = ?' for k in values.keys()])
     sql = f"UPDATE {TABLE_NAME} SET {assignments} WHERE id = ?"
-    c.execute(sql, list(values.values()) + [record_id])
-    conn.commit()
-    conn.close()
+    conn, lock = get_conn()
+    with lock:
+        with conn:
+            conn.execute(sql, list(to_db_values(values).values()) + [record_id])
+        bump_db_version()
 
 def delete_record(record_id: int):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute(f"DELETE FROM {TABLE_NAME} WHERE id = ?", (record_id,))
-    conn.commit()
-    conn.close()
+    conn, lock = get_conn()
+    with lock:
+        with conn:
+            conn.execute(f"DELETE FROM {TABLE_NAME} WHERE id = ?", (record_id,))
+        bump_db_version()
 
 # ========= App =========
 init_db()
 st.title("📋 Bienes y Servicios - Seguimiento de Contratos")
 
 with st.spinner("Cargando datos..."):
-    df_all = df_from_db()
+    df_all = load_df(db_version())
 
 # ---- Sidebar con botones (Exportar Excel queda de último) ----
 st.sidebar.header("Menú Principal")
@@ -206,16 +466,82 @@ if 'current_page' not in st.session_state:
     st.session_state.current_page = "Ver Contratos"
 
 for icon_label, page_value in MENU:
+    # El clic ya provoca un rerun y las páginas se evalúan después de este bucle
     if st.sidebar.button(icon_label, use_container_width=True):
         st.session_state.current_page = page_value
-        st.rerun()
+
+# --- Selección y formulario de edición ---
+# Como fragmento: elegir otro registro solo vuelve a ejecutar esta parte de la página
+@st.fragment
+def edit_record_fragment():
+    # Etiquetas y fila salen de la misma versión: en un rerun del fragmento df_all puede estar desactualizado
+    version = db_version()
+    labels, id_by_label = record_options(version)
+    sel_label = st.selectbox("Selecciona un registro para editar", options=[''] + labels)
+
+    if sel_label:
+        rid = id_by_label[sel_label]
+        df = load_df(version)
+        row = df[df['id'] == rid].iloc[0]
+        # Valores del registro convertidos una sola vez para todos los controles
+        row_num = {c: _to_int(row[c]) for c in MONEY_COLUMNS}
+        row_str = {c: _to_str(row[c]) for c in COLUMNS if c not in TYPED_COLUMNS}
+        row_date = {c: _to_date(row[c]) for c in DATE_COLUMNS}
+        st.markdown(f"**Editando registro:** {sel_label}")
+
+        with st.form("edit_form"):
+            new_vals = {}
+
+            tab_info_basica, tab_fechas, tab_valores, tab_otros_detalles = st.tabs(["Información Básica", "Fechas Clave", "Valores Financieros", "Otros Detalles"])
+
+            with tab_info_basica:
+                cols1 = st.columns(2)
+                new_vals["Código Interno / Proceso"] = cols1[0].text_input("Código Interno / Proceso", value=row_str["Código Interno / Proceso"])
+                new_vals["Nombre del Proceso / Objeto del Contrato"] = cols1[1].text_input("Nombre del Proceso / Objeto del Contrato", value=row_str["Nombre del Proceso / Objeto del Contrato"])
+                cols2 = st.columns(3)
+                new_vals["Estado Actual del Proceso"] = cols2[0].selectbox("Estado Actual del Proceso", options=[''] + ESTADO_PROCESO_OPTS, index=ESTADO_IDX.get(row_str["Estado Actual del Proceso"], 0))
+                new_vals["Tipo de Contrato"] = cols2[1].selectbox("Tipo de Contrato", options=[''] + TIPO_CONTRATO_OPTS, index=TIPO_IDX.get(row_str["Tipo de Contrato"], 0))
+                new_vals["Fuente de financiamiento"] = cols2[2].selectbox("Fuente de financiamiento", options=[''] + FUENTE_FINANCIAMIENTO_OPTS, index=FUENTE_IDX.get(row_str["Fuente de financiamiento"], 0))
+                new_vals["Modalidad de selección"] = st.selectbox("Modalidad de selección", options=[''] + MODALIDAD_SELECCION_OPTS, index=MODALIDAD_IDX.get(row_str["Modalidad de selección"], 0))
+                new_vals["Proveedor / Contratista"] = st.text_input("Proveedor / Contratista", value=row_str["Proveedor / Contratista"])
+                new_vals["Supervisor"] = st.text_input("Supervisor", value=row_str["Supervisor"])
+                new_vals["Supervisor (Apoyo)"] = st.text_input("Supervisor (Apoyo)", value=row_str["Supervisor (Apoyo)"])
+
+            with tab_fechas:
+                cols3 = st.columns(3)
+                new_vals["Fecha de estructuración"] = cols3[0].date_input("Fecha de estructuración", value=row_date["Fecha de estructuración"])
+                new_vals["Fecha de envio a Contratos"] = cols3[1].date_input("Fecha de envio a Contratos", value=row_date["Fecha de envio a Contratos"])
+                new_vals["Fecha de respuesta de contratos"] = cols3[2].date_input("Fecha de respuesta de contratos", value=row_date["Fecha de respuesta de contratos"])
+                cols4 = st.columns(3)
+                new_vals["Fecha acta de inicio / Fecha Inicio"] = cols4[0].date_input("Fecha acta de inicio / Fecha Inicio", value=row_date["Fecha acta de inicio / Fecha Inicio"])
+                new_vals["Fecha Final Contrato"] = cols4[1].date_input("Fecha Final Contrato", value=row_date["Fecha Final Contrato"])
+                new_vals["Fecha final de licencia/servicio"] = cols4[2].date_input("Fecha final de licencia/servicio", value=row_date["Fecha final de licencia/servicio"])
+                cols5 = st.columns(2)
+                new_vals["Mes de inicio1"] = cols5[0].selectbox("Mes de inicio1", MESES, index=MESES_IDX.get(row_str["Mes de inicio1"], 0))
+                new_vals["Mes de inicio2"] = cols5[1].selectbox("Mes de inicio2", MESES, index=MESES_IDX.get(row_str["Mes de inicio2"], 0))
+
+            with tab_valores:
+                for fields in MONEY_FIELD_ROWS:
+                    for col, field in zip(st.columns(len(fields)), fields):
+                        new_vals[field] = col.number_input(f"{field} ($)", value=row_num[field], step=1)
+
+            with tab_otros_detalles:
+                for field in OTHER_TEXT_FIELDS:
+                    new_vals[field] = st.text_input(field, value=row_str[field])
+
+            st.markdown("---")
+            if st.form_submit_button("💾 Actualizar Registro", use_container_width=True):
+                to_save = form_to_text(new_vals)
+                update_record(rid, to_save)
+                st.success("Registro actualizado correctamente.")
+                st.rerun()
 
 # =======================
 # Páginas
 # =======================
 
 # --- Tablero de control ---
-if st.session_state.current_page == "Tablero de Control":
+def page_dashboard():
     st.header("📊 Tablero de Control General")
     st.markdown("---")
 
@@ -238,13 +564,14 @@ if st.session_state.current_page == "Tablero de Control":
         df_display = pd.DataFrame()
 
     if not df_display.empty:
-        df_display['Semaforo'] = df_display.apply(compute_alert_color, axis=1)
+        df_display['Semaforo'] = compute_alert_colors(df_display)
 
+        semaforo_value_counts = df_display['Semaforo'].value_counts()
         total_contratos = len(df_display)
-        contratos_rojo = df_display['Semaforo'].tolist().count('🔴')
-        contratos_amarillo = df_display['Semaforo'].tolist().count('🟡')
-        contratos_verde = df_display['Semaforo'].tolist().count('🟢')
-        contratos_sin_fecha = df_display['Semaforo'].tolist().count('⚪')
+        contratos_rojo = semaforo_value_counts.get('🔴', 0)
+        contratos_amarillo = semaforo_value_counts.get('🟡', 0)
+        contratos_verde = semaforo_value_counts.get('🟢', 0)
+        contratos_sin_fecha = semaforo_value_counts.get('⚪', 0)
 
         col1, col2, col3, col4, col5 = st.columns(5)
         col1.metric("📑 Total", total_contratos)
@@ -257,8 +584,7 @@ if st.session_state.current_page == "Tablero de Control":
         # Métricas adicionales si hay contrato seleccionado
         if selected_contract != 'Todos los Contratos':
             contrato_iniciado = "Sí" if df_display[df_display["Estado Actual del Proceso"] == "Iniciado"].shape[0] > 0 else "No"
-            valor_estimado = pd.to_numeric(df_display["Valor estimado en la vigencia actual"], errors='coerce').sum()
-            valor_contratado = pd.to_numeric(df_display["Valor contratado"], errors='coerce').sum()
+            valor_estimado, valor_contratado = df_display[["Valor estimado en la vigencia actual", "Valor contratado"]].sum()
 
             st.markdown("### Resumen del Contrato Seleccionado")
             col_single1, col_single2, col_single3 = st.columns(3)
@@ -271,7 +597,8 @@ if st.session_state.current_page == "Tablero de Control":
         c1, c2 = st.columns(2)
         with c1:
             st.subheader("📌 Distribución por Estado Actual")
-            estado_counts = df_display["Estado Actual del Proceso"].value_counts().reset_index()
+            # En columnas category, value_counts incluye categorías sin filas
+            estado_counts = df_display["Estado Actual del Proceso"].value_counts().loc[lambda s: s > 0].head(MAX_BAR_CATEGORIES).reset_index()
             estado_counts.columns = ['Estado', 'Conteo']
             fig1 = px.bar(
                 estado_counts,
@@ -283,7 +610,7 @@ if st.session_state.current_page == "Tablero de Control":
             st.plotly_chart(fig1, use_container_width=True)
         with c2:
             st.subheader("📌 Distribución de Alertas (Semáforo)")
-            semaforo_counts = df_display["Semaforo"].value_counts().reset_index()
+            semaforo_counts = semaforo_value_counts.reset_index()
             semaforo_counts.columns = ['Color', 'Conteo']
             color_map = {'🟢': 'green', '🟡': 'yellow', '🔴': 'red', '⚪': 'gray'}
             fig2 = px.pie(
@@ -299,7 +626,7 @@ if st.session_state.current_page == "Tablero de Control":
         c3, c4 = st.columns(2)
         with c3:
             st.subheader("📌 Contratos por Fuente de financiamiento")
-            fuente_counts = df_display["Fuente de financiamiento"].value_counts().reset_index()
+            fuente_counts = df_display["Fuente de financiamiento"].value_counts().loc[lambda s: s > 0].head(MAX_BAR_CATEGORIES).reset_index()
             fuente_counts.columns = ['Fuente', 'Conteo']
             fig3 = px.bar(
                 fuente_counts,
@@ -311,7 +638,7 @@ if st.session_state.current_page == "Tablero de Control":
             st.plotly_chart(fig3, use_container_width=True)
         with c4:
             st.subheader("📌 Contratos por Modalidad de Selección")
-            modalidad_counts = df_display["Modalidad de selección"].value_counts().reset_index()
+            modalidad_counts = df_display["Modalidad de selección"].value_counts().loc[lambda s: s > 0].reset_index()
             modalidad_counts.columns = ['Modalidad', 'Conteo']
             fig4 = px.pie(
                 modalidad_counts,
@@ -325,52 +652,48 @@ if st.session_state.current_page == "Tablero de Control":
         # Procesos por fecha de inicio
         st.markdown("---")
         st.subheader("📌 Procesos por Fecha de Inicio")
-        df_display['Fecha acta de inicio / Fecha Inicio'] = pd.to_datetime(df_display['Fecha acta de inicio / Fecha Inicio'], errors='coerce')
-        df_start_dates = df_display.dropna(subset=['Fecha acta de inicio / Fecha Inicio']).copy()
-        df_start_dates['Año-Mes'] = df_start_dates['Fecha acta de inicio / Fecha Inicio'].dt.to_period('M').astype(str)
+        start_counts = start_counts_by_month(
+            db_version(),
+            None if selected_contract == 'Todos los Contratos' else selected_contract
+        )
 
-        if not df_start_dates.empty:
-            start_counts = df_start_dates['Año-Mes'].value_counts().sort_index().reset_index()
-            start_counts.columns = ['Año-Mes', 'Conteo']
+        if not start_counts.empty:
             fig5 = px.line(
                 start_counts,
                 x="Año-Mes",
                 y="Conteo",
                 title="Cantidad de Procesos Iniciados por Mes",
-                markers=True
+                markers=True,
+                render_mode='webgl'
             )
             st.plotly_chart(fig5, use_container_width=True)
         else:
             st.info("No hay fechas de inicio registradas para este filtro.")
 
 # --- Alertas ---
-elif st.session_state.current_page == "Alertas de Vencimiento":
+def page_alerts():
     st.header("🚨 Alertas de Vencimiento de Contratos")
     st.markdown("---")
     if df_all.empty:
         st.info("No hay registros que mostrar.")
     else:
-        df_alerts = df_all[df_all.apply(lambda row: compute_alert_color(row) in ['🔴', '🟡'], axis=1)].copy()
+        days = days_remaining(df_all)
+        semaforo = compute_alert_colors(df_all, days)
+        mask = semaforo.isin(['🔴', '🟡'])
+        df_alerts = df_all.loc[mask].assign(**{'Días Restantes': days[mask].astype('Int64'), 'Semaforo': semaforo[mask]})
         if not df_alerts.empty:
-            df_alerts['Días Restantes'] = df_alerts.apply(
-                lambda row: (safe_parse_date(row.get('Fecha Final Contrato')) - date.today()).days if safe_parse_date(row.get('Fecha Final Contrato')) else None,
-                axis=1
-            )
-            df_alerts['Semaforo'] = df_alerts.apply(compute_alert_color, axis=1)
             cols_show = ['Semaforo', 'Días Restantes', 'Fecha Final Contrato', 'Código Interno / Proceso', 'Nombre del Proceso / Objeto del Contrato', 'Proveedor / Contratista', 'Supervisor']
 
-            # Formatear fecha
-            df_alerts['Fecha Final Contrato'] = df_alerts['Fecha Final Contrato'].apply(format_date_only)
+            # Formatear fecha (la columna ya es datetime64: un solo strftime vectorizado)
+            df_alerts['Fecha Final Contrato'] = df_alerts['Fecha Final Contrato'].dt.strftime('%Y-%m-%d').fillna("")
             st.dataframe(df_alerts[cols_show].sort_values(by='Días Restantes', ascending=True), use_container_width=True)
         else:
             st.success("¡No hay contratos en estado de alerta (rojo o amarillo)!")
 
 # --- Ver contratos (con filtros accesibles) ---
-elif st.session_state.current_page == "Ver Contratos":
+def page_contracts():
     st.header("🔍 Ver Contratos")
     st.markdown("---")
-    filtered_df = df_all.copy()
-
     with st.expander("Filtros avanzados 🔎"):
         filter_cols = st.multiselect(
             "Selecciona las columnas para filtrar",
@@ -378,61 +701,60 @@ elif st.session_state.current_page == "Ver Contratos":
             help="Activa los filtros que necesites para acotar los resultados."
         )
         if filter_cols:
-            for col in filter_cols:
-                if "Fecha" in col:
-                    try:
-                        temp_df = filtered_df.copy()
-                        temp_df[f'{col}_date'] = pd.to_datetime(temp_df[col], errors='coerce').dt.date
-                        min_date, max_date = temp_df[f'{col}_date'].min(), temp_df[f'{col}_date'].max()
-                        if pd.notna(min_date) and pd.notna(max_date):
-                            start_date, end_date = st.date_input(
-                                f"Rango de Fechas para **{col}**",
-                                value=(min_date, max_date),
-                                min_value=min_date,
-                                max_value=max_date,
-                                key=f'date_filter_{col}',
-                                help="Selecciona un rango de fechas para filtrar."
-                            )
-                            filtered_df = filtered_df[pd.to_datetime(filtered_df[col], errors='coerce').dt.date.between(start_date, end_date)]
-                    except Exception as e:
-                        st.warning(f"No se pudo aplicar el filtro de fecha para '{col}'. Error: {e}")
-                elif "Valor" in col or "Saldo" in col or "Adición" in col:
-                    try:
-                        temp_df = filtered_df.copy()
-                        temp_df[f'{col}_numeric'] = pd.to_numeric(temp_df[col], errors='coerce')
-                        min_val, max_val = temp_df[f'{col}_numeric'].min(), temp_df[f'{col}_numeric'].max()
-                        if pd.notna(min_val) and pd.notna(max_val):
-                            min_input, max_input = st.slider(
-                                f"Rango de Valores para **{col}**",
-                                min_value=float(min_val),
-                                max_value=float(max_val),
-                                value=(float(min_val), float(max_val)),
-                                key=f'numeric_filter_{col}',
-                                help="Arrastra para definir el rango de valores."
-                            )
-                            filtered_df = filtered_df[pd.to_numeric(filtered_df[col], errors='coerce').between(min_input, max_input)]
-                    except Exception as e:
-                        st.warning(f"No se pudo aplicar el filtro numérico para '{col}'. Error: {e}")
-                elif col in ["Estado Actual del Proceso", "Tipo de Contrato", "Fuente de financiamiento", "Modalidad de selección", "Proveedor / Contratista", "Supervisor", "Código Interno / Proceso", "Nombre del Proceso / Objeto del Contrato"]:
-                    options = sorted(list(filtered_df[col].dropna().unique()))
-                    selected_options = st.multiselect(
-                        f"Filtra por **{col}**",
-                        options=options,
-                        key=f'multiselect_filter_{col}',
-                        help="Puedes elegir múltiples opciones."
-                    )
-                    if selected_options:
-                        filtered_df = filtered_df[filtered_df[col].isin(selected_options)]
-                else:
-                    search_term = st.text_input(
-                        f"Busca en **{col}**",
-                        "",
-                        key=f'text_filter_{col}',
-                        placeholder="Escribe para filtrar…",
-                        help="Búsqueda contiene (no sensible a mayúsculas)."
-                    )
-                    if search_term:
-                        filtered_df = filtered_df[filtered_df[col].astype(str).str.contains(search_term, case=False, na=False)]
+            # Los controles van en un formulario: se aplica todo junto con un solo rerun
+            with st.form("filtros"):
+                filters = {}
+                for col in filter_cols:
+                    if col in DATE_COLUMNS:
+                        try:
+                            min_date, max_date = column_ranges(db_version())[col]
+                            if pd.notna(min_date) and pd.notna(max_date):
+                                filters[col] = st.date_input(
+                                    f"Rango de Fechas para **{col}**",
+                                    value=(min_date, max_date),
+                                    min_value=min_date,
+                                    max_value=max_date,
+                                    key=f'date_filter_{col}',
+                                    help="Selecciona un rango de fechas para filtrar."
+                                )
+                        except Exception as e:
+                            st.warning(f"No se pudo aplicar el filtro de fecha para '{col}'. Error: {e}")
+                    elif col in MONEY_COLUMNS:
+                        try:
+                            min_val, max_val = column_ranges(db_version())[col]
+                            if pd.notna(min_val) and pd.notna(max_val):
+                                filters[col] = st.slider(
+                                    f"Rango de Valores para **{col}**",
+                                    min_value=float(min_val),
+                                    max_value=float(max_val),
+                                    value=(float(min_val), float(max_val)),
+                                    key=f'numeric_filter_{col}',
+                                    help="Arrastra para definir el rango de valores."
+                                )
+                        except Exception as e:
+                            st.warning(f"No se pudo aplicar el filtro numérico para '{col}'. Error: {e}")
+                    elif col in MULTISELECT_FILTER_COLUMNS:
+                        options = sorted(list(df_all[col].dropna().unique()))
+                        filters[col] = st.multiselect(
+                            f"Filtra por **{col}**",
+                            options=options,
+                            key=f'multiselect_filter_{col}',
+                            help="Puedes elegir múltiples opciones."
+                        )
+                    else:
+                        filters[col] = st.text_input(
+                            f"Busca en **{col}**",
+                            "",
+                            key=f'text_filter_{col}',
+                            placeholder="Escribe para filtrar…",
+                            help="Búsqueda contiene (no sensible a mayúsculas)."
+                        )
+                if st.form_submit_button("🔎 Aplicar filtros", use_container_width=True):
+                    st.session_state.filtros_aplicados = filters
+
+    # Se guardan los criterios (no el resultado) para filtrar siempre sobre los datos vigentes
+    applied = {col: value for col, value in st.session_state.get('filtros_aplicados', {}).items() if col in filter_cols}
+    filtered_df = query_contracts(db_version(), applied) if applied else df_all
 
     st.markdown("---")
     st.subheader(f"Resultados ({len(filtered_df)} contratos)")
@@ -440,26 +762,21 @@ elif st.session_state.current_page == "Ver Contratos":
     if filtered_df.empty:
         st.info("No se encontraron contratos que coincidan con los filtros.")
     else:
-        df_display = filtered_df.copy()
-
-        for col in ["Valor estimado en la vigencia actual", "Adición CDP", "Valor disminuido CDP", "Valor total CDP", "Valor contratado", "Saldo disponible CDP", "Adición en la ejecución", "Valor total contratado"]:
-            df_display[col] = df_display[col].apply(format_currency)
-
-        for col in ["Fecha de estructuración", "Fecha de envio a Contratos", "Fecha de respuesta de contratos", "Fecha acta de inicio / Fecha Inicio", "Fecha Final Contrato", "Fecha final de licencia/servicio"]:
-            df_display[col] = df_display[col].apply(format_date_only)
+        df_display = filtered_df.assign(**{"Número del contrato": format_numeric_series(filtered_df["Número del contrato"])})
 
-        df_display["Número del contrato"] = df_display["Número del contrato"].apply(format_numeric_no_decimals)
-        df_display["Mes de inicio1"] = df_display["Mes de inicio1"].apply(format_numeric_no_decimals)
-        df_display["Mes de inicio2"] = df_display["Mes de inicio2"].apply(format_numeric_no_decimals)
+        # Valores y fechas viajan con su tipo nativo; el formato lo aplica el navegador
+        column_config = {col: st.column_config.NumberColumn(format="$ %,d") for col in MONEY_COLUMNS}
+        column_config.update({col: st.column_config.DateColumn(format="YYYY-MM-DD") for col in DATE_COLUMNS})
 
         cols_show = [c for c in COLUMNS if c in df_display.columns]
         st.dataframe(
             df_display[cols_show].sort_values(by='Código Interno / Proceso', ascending=True),
+            column_config=column_config,
             use_container_width=True
         )
 
 # --- Agregar registro ---
-elif st.session_state.current_page == "Agregar registro":
+def page_add():
     st.header("🆕 Agregar nuevo registro de Bienes y Servicios")
     st.markdown("---")
 
@@ -519,100 +836,31 @@ elif st.session_state.current_page == "Agregar registro":
 
         st.markdown("---")
         if st.form_submit_button("✅ Guardar Registro", use_container_width=True):
-            values = {k: v.isoformat() if isinstance(v, (date, datetime)) else str(v) if v is not None else "" for k, v in inputs.items()}
+            values = form_to_text(inputs)
             insert_record(values)
             st.success("Registro creado correctamente.")
             st.rerun()
 
 # --- Editar registro ---
-elif st.session_state.current_page == "Editar registro":
+def page_edit():
     st.header("✏️ Editar registro existente")
     st.markdown("---")
     if df_all.empty:
         st.info("No hay registros para editar")
     else:
-        opts = df_all[['id', 'Código Interno / Proceso', 'Nombre del Proceso / Objeto del Contrato']].fillna("")
-        opts['label'] = opts['Código Interno / Proceso'] + ' — ' + opts['Nombre del Proceso / Objeto del Contrato']
-        sel_label = st.selectbox("Selecciona un registro para editar", options=[''] + opts['label'].tolist())
-
-        if sel_label:
-            rid = int(opts.loc[opts['label'] == sel_label, 'id'].values[0])
-            row = df_all[df_all['id'] == rid].iloc[0]
-            st.markdown(f"**Editando registro:** {sel_label}")
-
-            with st.form("edit_form"):
-                new_vals = {}
-
-                tab_info_basica, tab_fechas, tab_valores, tab_otros_detalles = st.tabs(["Información Básica", "Fechas Clave", "Valores Financieros", "Otros Detalles"])
-
-                with tab_info_basica:
-                    cols1 = st.columns(2)
-                    new_vals["Código Interno / Proceso"] = cols1[0].text_input("Código Interno / Proceso", value=row.get("Código Interno / Proceso", ""))
-                    new_vals["Nombre del Proceso / Objeto del Contrato"] = cols1[1].text_input("Nombre del Proceso / Objeto del Contrato", value=row.get("Nombre del Proceso / Objeto del Contrato", ""))
-                    cols2 = st.columns(3)
-                    new_vals["Estado Actual del Proceso"] = cols2[0].selectbox("Estado Actual del Proceso", options=[''] + ESTADO_PROCESO_OPTS, index=ESTADO_PROCESO_OPTS.index(row.get("Estado Actual del Proceso", "")) + 1 if row.get("Estado Actual del Proceso", "") in ESTADO_PROCESO_OPTS else 0)
-                    new_vals["Tipo de Contrato"] = cols2[1].selectbox("Tipo de Contrato", options=[''] + TIPO_CONTRATO_OPTS, index=TIPO_CONTRATO_OPTS.index(row.get("Tipo de Contrato", "")) + 1 if row.get("Tipo de Contrato", "") in TIPO_CONTRATO_OPTS else 0)
-                    new_vals["Fuente de financiamiento"] = cols2[2].selectbox("Fuente de financiamiento", options=[''] + FUENTE_FINANCIAMIENTO_OPTS, index=FUENTE_FINANCIAMIENTO_OPTS.index(row.get("Fuente de financiamiento", "")) + 1 if row.get("Fuente de financiamiento", "") in FUENTE_FINANCIAMIENTO_OPTS else 0)
-                    new_vals["Modalidad de selección"] = st.selectbox("Modalidad de selección", options=[''] + MODALIDAD_SELECCION_OPTS, index=MODALIDAD_SELECCION_OPTS.index(row.get("Modalidad de selección", "")) + 1 if row.get("Modalidad de selección", "") in MODALIDAD_SELECCION_OPTS else 0)
-                    new_vals["Proveedor / Contratista"] = st.text_input("Proveedor / Contratista", value=row.get("Proveedor / Contratista", ""))
-                    new_vals["Supervisor"] = st.text_input("Supervisor", value=row.get("Supervisor", ""))
-                    new_vals["Supervisor (Apoyo)"] = st.text_input("Supervisor (Apoyo)", value=row.get("Supervisor (Apoyo)", ""))
-
-                with tab_fechas:
-                    cols3 = st.columns(3)
-                    new_vals["Fecha de estructuración"] = cols3[0].date_input("Fecha de estructuración", value=safe_parse_date(row.get("Fecha de estructuración")))
-                    new_vals["Fecha de envio a Contratos"] = cols3[1].date_input("Fecha de envio a Contratos", value=safe_parse_date(row.get("Fecha de envio a Contratos")))
-                    new_vals["Fecha de respuesta de contratos"] = cols3[2].date_input("Fecha de respuesta de contratos", value=safe_parse_date(row.get("Fecha de respuesta de contratos")))
-                    cols4 = st.columns(3)
-                    new_vals["Fecha acta de inicio / Fecha Inicio"] = cols4[0].date_input("Fecha acta de inicio / Fecha Inicio", value=safe_parse_date(row.get("Fecha acta de inicio / Fecha Inicio")))
-                    new_vals["Fecha Final Contrato"] = cols4[1].date_input("Fecha Final Contrato", value=safe_parse_date(row.get("Fecha Final Contrato")))
-                    new_vals["Fecha final de licencia/servicio"] = cols4[2].date_input("Fecha final de licencia/servicio", value=safe_parse_date(row.get("Fecha final de licencia/servicio")))
-                    cols5 = st.columns(2)
-                    new_vals["Mes de inicio1"] = cols5[0].selectbox("Mes de inicio1", MESES, index=MESES.index(row.get("Mes de inicio1", "")) if row.get("Mes de inicio1", "") in MESES else 0)
-                    new_vals["Mes de inicio2"] = cols5[1].selectbox("Mes de inicio2", MESES, index=MESES.index(row.get("Mes de inicio2", "")) if row.get("Mes de inicio2", "") in MESES else 0)
-
-                with tab_valores:
-                    cols6 = st.columns(3)
-                    new_vals["Valor estimado en la vigencia actual"] = cols6[0].number_input("Valor estimado en la vigencia actual ($)", value=int(float(row.get("Valor estimado en la vigencia actual", 0))) if row.get("Valor estimado en la vigencia actual") else 0, step=1)
-                    new_vals["Adición CDP"] = cols6[1].number_input("Adición CDP ($)", value=int(float(row.get("Adición CDP", 0))) if row.get("Adición CDP") else 0, step=1)
-                    new_vals["Valor disminuido CDP"] = cols6[2].number_input("Valor disminuido CDP ($)", value=int(float(row.get("Valor disminuido CDP", 0))) if row.get("Valor disminuido CDP") else 0, step=1)
-                    cols7 = st.columns(3)
-                    new_vals["Valor total CDP"] = cols7[0].number_input("Valor total CDP ($)", value=int(float(row.get("Valor total CDP", 0))) if row.get("Valor total CDP") else 0, step=1)
-                    new_vals["Valor contratado"] = cols7[1].number_input("Valor contratado ($)", value=int(float(row.get("Valor contratado", 0))) if row.get("Valor contratado") else 0, step=1)
-                    new_vals["Saldo disponible CDP"] = cols7[2].number_input("Saldo disponible CDP ($)", value=int(float(row.get("Saldo disponible CDP", 0))) if row.get("Saldo disponible CDP") else 0, step=1)
-                    cols8 = st.columns(2)
-                    new_vals["Adición en la ejecución"] = cols8[0].number_input("Adición en la ejecución ($)", value=int(float(row.get("Adición en la ejecución", 0))) if row.get("Adición en la ejecución") else 0, step=1)
-                    new_vals["Valor total contratado"] = cols8[1].number_input("Valor total contratado ($)", value=int(float(row.get("Valor total contratado", 0))) if row.get("Valor total contratado") else 0, step=1)
-
-                with tab_otros_detalles:
-                    new_vals["Número del contrato"] = st.text_input("Número del contrato", value=row.get("Número del contrato", ""))
-                    new_vals["Abogado OTIC"] = st.text_input("Abogado OTIC", value=row.get("Abogado OTIC", ""))
-                    new_vals["Estructurador Técnico OTIC"] = st.text_input("Estructurador Técnico OTIC", value=row.get("Estructurador Técnico OTIC", ""))
-                    new_vals["Abogados GIT Gestión Contractual"] = st.text_input("Abogados GIT Gestión Contractual", value=row.get("Abogados GIT Gestión Contractual", ""))
-                    new_vals["Economico GIT"] = st.text_input("Economico GIT", value=row.get("Economico GIT", ""))
-                    new_vals["Enlace SharePoint"] = st.text_input("Enlace SharePoint", value=row.get("Enlace SharePoint", ""))
-                    new_vals["Seguimiento periódico"] = st.text_input("Seguimiento periódico", value=row.get("Seguimiento periódico", ""))
-                    new_vals["Alerta Enviada"] = st.text_input("Alerta Enviada", value=row.get("Alerta Enviada", ""))
-
-                st.markdown("---")
-                if st.form_submit_button("💾 Actualizar Registro", use_container_width=True):
-                    to_save = {k: v.isoformat() if isinstance(v, (date, datetime)) else str(v) if v is not None else "" for k, v in new_vals.items()}
-                    update_record(rid, to_save)
-                    st.success("Registro actualizado correctamente.")
-                    st.rerun()
+        edit_record_fragment()
 
 # --- Eliminar registro ---
-elif st.session_state.current_page == "Eliminar registro":
+def page_delete():
     st.header("🗑️ Eliminar registro existente")
     st.markdown("---")
     if df_all.empty:
         st.info("No hay registros para eliminar")
     else:
-        opts = df_all[['id', 'Código Interno / Proceso', 'Nombre del Proceso / Objeto del Contrato']].fillna("")
-        opts['label'] = opts['Código Interno / Proceso'] + ' — ' + opts['Nombre del Proceso / Objeto del Contrato']
-        sel_label = st.selectbox("Selecciona un registro para eliminar", options=[''] + opts['label'].tolist())
+        labels, id_by_label = record_options(db_version())
+        sel_label = st.selectbox("Selecciona un registro para eliminar", options=[''] + labels)
         if sel_label:
-            rid = int(opts.loc[opts['label'] == sel_label, 'id'].values[0])
+            rid = id_by_label[sel_label]
             st.warning(f"⚠️ ¿Estás seguro de que deseas eliminar el registro: **{sel_label}**?")
             if st.button("❌ Confirmar eliminación", use_container_width=True):
                 delete_record(rid)
@@ -620,33 +868,33 @@ elif st.session_state.current_page == "Eliminar registro":
                 st.rerun()
 
 # --- Exportar Excel (último en el menú) ---
-elif st.session_state.current_page == "Exportar Excel":
+def page_export():
     st.header("📤 Exportar base a Excel")
     st.markdown("---")
     if df_all.empty:
         st.info("No hay datos para exportar.")
     else:
-        output = io.BytesIO()
-        df_export = df_all.drop(columns=['id'], errors='ignore').copy()
-
-        # Fechas a ISO (YYYY-MM-DD)
-        for col in ["Fecha de estructuración", "Fecha de envio a Contratos", "Fecha de respuesta de contratos", "Fecha acta de inicio / Fecha Inicio", "Fecha Final Contrato", "Fecha final de licencia/servicio"]:
-            df_export[col] = df_export[col].apply(lambda x: safe_parse_date(x).isoformat() if safe_parse_date(x) else "")
-
-        # Convertir a numérico cuando aplique
-        for col in ["Número del contrato", "Mes de inicio1", "Mes de inicio2", "Valor estimado en la vigencia actual", "Adición CDP", "Valor disminuido CDP", "Valor total CDP", "Valor contratado", "Saldo disponible CDP", "Adición en la ejecución", "Valor total contratado"]:
-            try:
-                df_export[col] = pd.to_numeric(df_export[col], errors='coerce')
-            except Exception:
-                pass
-
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df_export.to_excel(writer, index=False, sheet_name="Contratos")
-
-        st.download_button(
-            "⬇️ Descargar Excel",
-            data=output.getvalue(),
-            file_name="contratos_export.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            use_container_width=True
-        )
+        # El libro solo se arma al pedirlo; si los datos cambian después hay que generarlo de nuevo
+        if st.button("📦 Generar archivo", use_container_width=True):
+            st.session_state.export_version = db_version()
+        if st.session_state.get('export_version') == db_version():
+            st.download_button(
+                "⬇️ Descargar Excel",
+                data=export_xlsx(db_version()),
+                file_name="contratos_export.xlsx",
+                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                use_container_width=True
+            )
+
+# Despacho de la página activa
+PAGES = {
+    "Tablero de Control": page_dashboard,
+    "Alertas de Vencimiento": page_alerts,
+    "Ver Contratos": page_contracts,
+    "Agregar registro": page_add,
+    "Editar registro": page_edit,
+    "Eliminar registro": page_delete,
+    "Exportar Excel": page_export
+}
+
+PAGES[st.session_state.current_page]()